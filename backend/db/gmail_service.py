@@ -1,22 +1,79 @@
 from dotenv import load_dotenv
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.model import JsonModel
 from google.auth.transport.requests import Request
+from backend.db.database import SessionLocal
 from backend.db.models import User, Email
+from backend.services.send_email import fast_b64decode
+from email.message import Message
 from email.utils import parsedate_to_datetime
 import os
-import base64
-from datetime import datetime
+import logging
+import orjson
+import queue
+import requests
+import random
+import threading
+import time
+from datetime import datetime, timedelta
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 TOKEN_URL = "https://oauth2.googleapis.com/token"
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 
+# Google access tokens are valid for an hour from issue. google-auth already
+# reports them expired 3m45s early (REFRESH_THRESHOLD in its private
+# google.auth._helpers, mirrored here rather than imported), which forces an
+# inline refresh; start a background refresh 10 minutes before that point.
+ACCESS_TOKEN_LIFETIME = timedelta(hours=1)
+GOOGLE_AUTH_EXPIRY_SKEW = timedelta(minutes=3, seconds=45)
+REFRESH_AHEAD = GOOGLE_AUTH_EXPIRY_SKEW + timedelta(minutes=10)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
 
-def get_gmail_service(db, user_id: int):
-    """Get authenticated Gmail service for a user."""
+# One pooled session for every token refresh, so later refreshes reuse the
+# open connection to the token endpoint instead of a new TLS handshake
+_AUTH_REQUEST = Request(session=requests.Session())
+
+# Gmail rejects batches with more than 100 inner requests
+GMAIL_BATCH_LIMIT = 100
+BATCH_MAX_ATTEMPTS = 3
+RETRYABLE_STATUSES = {429, 500, 503}
+
+# Parts of a message the sync actually reads
+FULL_MESSAGE_FIELDS = "labelIds,snippet,payload(headers,mimeType,body/data,parts)"
+
+# Gmail history ID of each user's last completed sync
+_history_ids = {}
+
+# messages.batchModify accepts at most 1000 IDs per call
+BATCH_MODIFY_LIMIT = 1000
+
+# Built Google API services, reused per thread (httplib2 connections are
+# not thread-safe) and rebuilt whenever the user's access token changes.
+_local = threading.local()
+
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that decodes API responses with orjson instead of stdlib json."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode("utf-8") if isinstance(content, bytes) else content
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+
+def _get_user(db, user_id: int) -> User:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise ValueError("User not found")
@@ -24,31 +81,129 @@ def get_gmail_service(db, user_id: int):
     if not user.access_token:
         raise ValueError("User not authenticated with Google")
 
-    creds = Credentials(
+    return user
+
+
+def _build_creds(user: User) -> Credentials:
+    expiry = user.token_created + ACCESS_TOKEN_LIFETIME if user.token_created else None
+    return Credentials(
         token=user.access_token,
         refresh_token=user.refresh_token,
         token_uri=TOKEN_URL,
         client_id=CLIENT_ID,
         client_secret=CLIENT_SECRET,
+        expiry=expiry,
     )
 
+
+def _save_token(db, user: User, creds: Credentials):
+    user.access_token = creds.token
+    user.token_created = datetime.utcnow()
+    db.commit()
+
+
+def _refresh_in_background(user_id: int):
+    """Refresh a user's token on a daemon thread, at most one refresh per user at a time."""
+    with _refreshing_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+
+    def _refresh():
+        db = SessionLocal()
+        try:
+            user = _get_user(db, user_id)
+            creds = _build_creds(user)
+            creds.refresh(_AUTH_REQUEST)
+            _save_token(db, user, creds)
+        except Exception as e:
+            logger.warning(f"Background token refresh failed for user {user_id}: {e}")
+        finally:
+            db.close()
+            with _refreshing_lock:
+                _refreshing.discard(user_id)
+
+    threading.Thread(target=_refresh, daemon=True, name=f"TokenRefresh-User{user_id}").start()
+
+
+def get_creds(db, user_id: int) -> Credentials:
+    """
+    Google OAuth credentials stored for a user. Expired tokens are refreshed
+    inline; tokens close to expiry are refreshed in the background so the
+    request does not wait on the token endpoint.
+    """
+    return _creds_for_user(db, _get_user(db, user_id))
+
+
+def _creds_for_user(db, user: User) -> Credentials:
+    creds = _build_creds(user)
+
+    if not creds.refresh_token:
+        return creds
+
     # Refresh token if expired
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        
+    if creds.expired:
+        creds.refresh(_AUTH_REQUEST)
+
         # Save new token to database
-        user.access_token = creds.token
-        db.commit()
+        _save_token(db, user, creds)
+    elif creds.expiry and creds.expiry - datetime.utcnow() < REFRESH_AHEAD:
+        _refresh_in_background(user.id)
+
+    return creds
+
+
+def _get_service(db, user_id: int, api: str, version: str):
+    # One user lookup serves both the credential check and the cache key
+    user = _get_user(db, user_id)
+    creds = _creds_for_user(db, user)
+
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+
+    cached = services.get((api, user_id))
+    if cached and cached[0] == creds.token:
+        return cached[1]
+
+    # Load the bundled discovery document instead of fetching it over HTTP
+    service = build(
+        api, version, credentials=creds, model=_OrjsonModel(),
+        cache_discovery=False, static_discovery=True,
+    )
+    services[(api, user_id)] = (creds.token, service)
+    return service
 
-    return build("gmail", "v1", credentials=creds)
+
+def get_gmail_service(db, user_id: int):
+    """Get authenticated Gmail service for a user."""
+    return _get_service(db, user_id, "gmail", "v1")
+
+
+def get_calendar_service(db, user_id: int):
+    """Get authenticated Google Calendar service for a user (same OAuth credentials as Gmail)."""
+    return _get_service(db, user_id, "calendar", "v3")
 
 
 def extract_body(payload):
     """Extract email body from Gmail payload."""
     import html2text
     
-    def decode_data(data):
-        return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+    def decode_data(part):
+        # Gmail strips the transfer encoding; the bytes are still in the part's charset
+        raw = fast_b64decode(part["body"]["data"])
+        content_type = next(
+            (h["value"] for h in part.get("headers", []) if h["name"].lower() == "content-type"), ""
+        )
+        header = Message()
+        header["Content-Type"] = content_type
+        charset = header.get_content_charset()
+        if charset:
+            try:
+                return raw.decode(charset, errors="replace")
+            except LookupError:
+                pass
+        return raw.decode("utf-8", errors="ignore")
     
     def extract_from_parts(parts):
         plain = None
@@ -64,9 +219,9 @@ def extract_body(payload):
                     return result
             
             if mime == "text/plain" and data:
-                plain = decode_data(data)
+                plain = decode_data(part)
             elif mime == "text/html" and data:
-                html = decode_data(data)
+                html = decode_data(part)
         
         if plain:
             return plain
@@ -80,7 +235,7 @@ def extract_body(payload):
 
     # Try direct body first
     if payload.get("body", {}).get("data"):
-        return decode_data(payload["body"]["data"])
+        return decode_data(payload)
 
     # Try parts
     if payload.get("parts"):
@@ -88,13 +243,152 @@ def extract_body(payload):
 
     return ""
 
-def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
+def get_plain_text(service, msg_id: str) -> str:
+    """
+    Fetch only the decoded payload of a message and return its body text.
+    Gmail parses the MIME tree server-side, so no raw message is downloaded.
+    """
+    msg_data = service.users().messages().get(
+        userId="me", id=msg_id, format="full", fields="payload"
+    ).execute()
+    return extract_body(msg_data.get("payload", {}))
+
+def _chunks(seq, n=GMAIL_BATCH_LIMIT):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+def batch_get_messages(service, message_ids: list, dropped: list = None, **get_kwargs) -> dict:
+    """
+    Fetch many messages through Gmail's batch endpoint, one HTTP request per
+    100 IDs instead of one per message. Items that fail with a retryable
+    status are resubmitted with backoff. Returns {message_id: message}; IDs
+    that still failed are appended to dropped, if given.
+    """
+    results = {}
+    failed = {}
+
+    def _cb(request_id, response, exception):
+        if exception is not None:
+            failed[request_id] = exception
+        else:
+            results[request_id] = response
+
+    pending = list(message_ids)
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(2 ** attempt + random.random())
+
+        failed.clear()
+        for chunk in _chunks(pending):
+            batch = service.new_batch_http_request(callback=_cb)
+            for msg_id in chunk:
+                batch.add(
+                    service.users().messages().get(userId="me", id=msg_id, **get_kwargs),
+                    request_id=msg_id,
+                )
+            batch.execute()
+
+        pending = []
+        for msg_id, exc in failed.items():
+            retryable = isinstance(exc, HttpError) and exc.resp.status in RETRYABLE_STATUSES
+            if retryable and attempt + 1 < BATCH_MAX_ATTEMPTS:
+                pending.append(msg_id)
+            else:
+                logger.warning(f"Failed to fetch message {msg_id}: {exc}")
+                if dropped is not None:
+                    dropped.append(msg_id)
+        if not pending:
+            break
+
+    return results
+
+def prefetch_messages(service, message_ids: list, dropped: list = None, **get_kwargs):
+    """
+    Yield (message_id, message) in order while the next batch of 100 is
+    downloaded on a background thread, so parsing and saving overlap the
+    HTTP round-trips. Messages that could not be fetched are skipped and
+    their IDs appended to dropped, if given.
+
+    The background thread borrows the caller's service. That is safe because
+    the caller must not use the service while iterating, and on exit the
+    generator waits for the in-flight batch to finish before returning, so
+    the service is never used from two threads at once.
+    """
+    batches = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _fetch_batches():
+        try:
+            for chunk in _chunks(message_ids):
+                if stop.is_set():
+                    break
+                _put((chunk, batch_get_messages(service, chunk, dropped, **get_kwargs)))
+        except Exception as e:
+            _put(e)
+        _put(None)
+
+    producer = threading.Thread(target=_fetch_batches, daemon=True, name="GmailPrefetch")
+    producer.start()
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            chunk, fetched = item
+            for msg_id in chunk:
+                if msg_id in fetched:
+                    yield msg_id, fetched[msg_id]
+    finally:
+        stop.set()
+        producer.join()
+
+def _check_history(service, user_id: int):
+    """
+    Ask Gmail whether anything changed since the last completed sync.
+    Returns (unchanged, current_history_id); the caller records the ID once
+    its sync succeeds, so a failed sync is retried on the next poll.
+    """
+    last_id = _history_ids.get(user_id)
+    if last_id:
+        try:
+            history = service.users().history().list(
+                userId="me", startHistoryId=last_id, maxResults=1, fields="history/id,historyId"
+            ).execute()
+            return not history.get("history"), history.get("historyId", last_id)
+        except HttpError as e:
+            # 404 means the stored ID is too old; fall back to a full sync
+            if e.resp.status != 404:
+                raise
+
+    profile = service.users().getProfile(userId="me", fields="historyId").execute()
+    return False, profile.get("historyId")
+
+def fetch_user_emails(db, user_id: int, max_results: int = 100, with_body: bool = True) -> int:
+    """
+    Sync new INBOX emails for a user. With with_body=False only headers and
+    snippets are downloaded; bodies are fetched on demand when an email is read.
+    """
     try:
         service = get_gmail_service(db, user_id)
 
+        # Skip the full sync when Gmail reports no mailbox changes since the last one
+        unchanged, history_id = _check_history(service, user_id)
+        if unchanged:
+            _history_ids[user_id] = history_id
+            return 0
+
         # Delete local emails that have been deleted or archived in Gmail inbox
         try:
-            inbox_results = service.users().messages().list(userId="me", maxResults=500, q="in:inbox").execute()
+            inbox_results = service.users().messages().list(
+                userId="me", maxResults=500, q="in:inbox", fields="messages/id"
+            ).execute()
             gmail_messages = inbox_results.get("messages", [])
             gmail_ids = {m["id"] for m in gmail_messages}
             
@@ -106,9 +400,9 @@ def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
                     deleted_count += 1
             if deleted_count > 0:
                 db.commit()
-                print(f"Deleted {deleted_count} local emails that were removed/archived in Gmail")
+                logger.info(f"Deleted {deleted_count} local emails that were removed/archived in Gmail")
         except Exception as sync_err:
-            print(f" Failed to sync active Gmail IDs: {sync_err}")
+            logger.warning(f"Failed to sync active Gmail IDs: {sync_err}")
 
         last_email = (
             db.query(Email)
@@ -123,9 +417,9 @@ def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
         if last_email and last_email.date:
             after_date = last_email.date.strftime("%Y/%m/%d")
             query_parts.append(f"after:{after_date}")
-            print(f"Fetching emails after {after_date}")
+            logger.debug(f"Fetching emails after {after_date}")
         else:
-            print("No valid date found - fetching latest emails")
+            logger.debug("No valid date found - fetching latest emails")
 
         # Always combine with inbox filter
         query_parts.append("in:inbox")
@@ -135,34 +429,43 @@ def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
             "userId": "me",
             "maxResults": max_results,
             "q": final_query,  # single clean query, never overwritten
+            "fields": "messages/id",  # only IDs are used
         }
 
-        print(f"Gmail query: {final_query}")
+        logger.debug(f"Gmail query: {final_query}")
 
         results = service.users().messages().list(**list_params).execute()
         messages = results.get("messages", [])
-        print(f" Gmail returned {len(messages)} messages")
+        logger.debug(f"Gmail returned {len(messages)} messages")
 
         if not messages:
+            _history_ids[user_id] = history_id
             return 0
 
         saved_count = 0
-        skipped_count = 0
 
-        for msg in messages:
-            exists = (
-                db.query(Email)
-                .filter(Email.message_id == msg["id"], Email.user_id == user_id)
-                .first()
+        # Skip messages already stored, then fetch the rest in batches
+        message_ids = [m["id"] for m in messages]
+        existing_ids = {
+            row.message_id
+            for row in db.query(Email.message_id).filter(
+                Email.user_id == user_id, Email.message_id.in_(message_ids)
             )
-            if exists:
-                skipped_count += 1
-                continue
-
-            msg_data = service.users().messages().get(
-                userId="me", id=msg["id"], format="full"
-            ).execute()
+        }
+        new_ids = [mid for mid in message_ids if mid not in existing_ids]
+        skipped_count = len(message_ids) - len(new_ids)
 
+        if with_body:
+            get_kwargs = {"format": "full", "fields": FULL_MESSAGE_FIELDS}
+        else:
+            get_kwargs = {
+                "format": "metadata",
+                "metadataHeaders": ["From", "Subject", "Date"],
+                "fields": "labelIds,snippet,payload/headers",
+            }
+
+        dropped = []
+        for msg_id, msg_data in prefetch_messages(service, new_ids, dropped, **get_kwargs):
             headers = msg_data.get("payload", {}).get("headers", [])
             subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
             sender = next((h["value"] for h in headers if h["name"] == "From"), "")
@@ -177,16 +480,16 @@ def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
 
             # Fix: only check INBOX, drop CATEGORY_PERSONAL requirement
             if "INBOX" not in labels:
-                print(f" Skipping non-INBOX: {subject[:50]}")
+                logger.debug(f"Skipping non-INBOX: {subject[:50]}")
                 continue
 
-            body = extract_body(msg_data["payload"])
+            body = extract_body(msg_data["payload"]) if with_body else None
             snippet = msg_data.get("snippet", "")
             labels_str = ",".join(labels)
 
             email = Email(
                 user_id=user_id,
-                message_id=msg["id"],
+                message_id=msg_id,
                 sender=sender,
                 subject=subject,
                 snippet=snippet,
@@ -203,13 +506,17 @@ def fetch_user_emails(db, user_id: int, max_results: int = 100) -> int:
             db.refresh(email)
             saved_count += 1
 
-        print(f"Saved {saved_count}, skipped {skipped_count} for user {user_id}")
+        logger.info(f"Saved {saved_count}, skipped {skipped_count} for user {user_id}")
+
+        # Keep the old history ID if any message was dropped, so the next poll relists it
+        if dropped:
+            logger.warning(f"{len(dropped)} messages could not be fetched for user {user_id}; will retry")
+        else:
+            _history_ids[user_id] = history_id
         return saved_count
 
     except Exception as e:
-        print(f"Error fetching emails: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error fetching emails: {e}")
         return 0
 
 def fetch_all_user_emails(db, user_id: int, max_results: int = 500) -> int:
@@ -220,44 +527,41 @@ def fetch_all_user_emails(db, user_id: int, max_results: int = 500) -> int:
     try:
         service = get_gmail_service(db, user_id)
         
-        print(f" Fetching ALL INBOX emails for user {user_id} (max: {max_results})")
+        logger.info(f"Fetching ALL INBOX emails for user {user_id} (max: {max_results})")
         
         # Fetch INBOX only
         list_params = {
             "userId": "me",
             "maxResults": max_results,
             "labelIds": ["INBOX"],  #  Only INBOX
+            "fields": "messages/id",
         }
         
         results = service.users().messages().list(**list_params).execute()
         messages = results.get("messages", [])
-        print(f" Gmail returned {len(messages)} INBOX messages")
+        logger.debug(f"Gmail returned {len(messages)} INBOX messages")
         
         if not messages:
-            print(" No messages found")
+            logger.info("No messages found")
             return 0
         
         saved_count = 0
-        skipped_count = 0
-
-        for msg in messages:
-            # Check if already exists
-            exists = (
-                db.query(Email)
-                .filter(Email.message_id == msg["id"], Email.user_id == user_id)
-                .first()
-            )
-            if exists:
-                skipped_count += 1
-                continue
 
-            # Fetch full message
-            msg_data = service.users().messages().get(
-                userId="me",
-                id=msg["id"],
-                format="full",
-            ).execute()
+        # Skip messages already stored
+        message_ids = [m["id"] for m in messages]
+        existing_ids = {
+            row.message_id
+            for row in db.query(Email.message_id).filter(
+                Email.user_id == user_id, Email.message_id.in_(message_ids)
+            )
+        }
+        new_ids = [mid for mid in message_ids if mid not in existing_ids]
+        skipped_count = len(message_ids) - len(new_ids)
 
+        # Fetch full messages in batches of 100
+        for msg_id, msg_data in prefetch_messages(
+            service, new_ids, format="full", fields=FULL_MESSAGE_FIELDS
+        ):
             headers = msg_data.get("payload", {}).get("headers", [])
             subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
             sender = next((h["value"] for h in headers if h["name"] == "From"), "")
@@ -266,7 +570,7 @@ def fetch_all_user_emails(db, user_id: int, max_results: int = 500) -> int:
             try:
                 email_date = parsedate_to_datetime(date_str) if date_str else datetime.utcnow()
             except Exception as e:
-                print(f" Failed to parse date '{date_str}': {e}")
+                logger.debug(f"Failed to parse date '{date_str}': {e}")
                 email_date = datetime.utcnow()
             
             body = extract_body(msg_data["payload"])
@@ -278,12 +582,12 @@ def fetch_all_user_emails(db, user_id: int, max_results: int = 500) -> int:
             
             # Verify INBOX
             if 'INBOX' not in labels:
-                print(f" Skipping non-INBOX email: {subject[:50]}")
+                logger.debug(f"Skipping non-INBOX email: {subject[:50]}")
                 continue
             
             email = Email(
                 user_id=user_id,
-                message_id=msg["id"],
+                message_id=msg_id,
                 sender=sender,
                 subject=subject,
                 snippet=snippet,
@@ -304,16 +608,14 @@ def fetch_all_user_emails(db, user_id: int, max_results: int = 500) -> int:
             
             # Print progress every 50 emails
             if saved_count % 50 == 0:
-                print(f" Progress: {saved_count}/{len(messages)} INBOX emails saved...")
+                logger.info(f"Progress: {saved_count}/{len(messages)} INBOX emails saved...")
         
-        print(f" Fetched and saved {saved_count} new INBOX emails, skipped {skipped_count} existing")
+        logger.info(f"Fetched and saved {saved_count} new INBOX emails, skipped {skipped_count} existing")
         
         return saved_count
         
     except Exception as e:
-        print(f" Error fetching all emails: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error fetching all emails: {e}")
         return 0
 
 
@@ -339,11 +641,48 @@ def mark_email_as_read(db, user_id: int, message_id: str) -> bool:
             email.is_read = True
             db.commit()
         
-        print(f"Marked email {message_id} as read")
+        logger.debug(f"Marked email {message_id} as read")
         return True
         
     except Exception as e:
-        print(f" Error marking email as read: {e}")
+        logger.error(f"Error marking email as read: {e}")
+        return False
+
+
+def mark_emails_as_read(db, user_id: int, message_ids: list) -> bool:
+    """Mark several emails as read with one Gmail batchModify call and update local DB."""
+    if not message_ids:
+        return True
+
+    try:
+        service = get_gmail_service(db, user_id)
+
+        # Remove UNREAD label with one request per 1000 messages
+        for chunk in _chunks(list(message_ids), BATCH_MODIFY_LIMIT):
+            service.users().messages().batchModify(
+                userId="me",
+                body={"ids": chunk, "removeLabelIds": ["UNREAD"]}
+            ).execute()
+
+        # Update local database
+        emails = db.query(Email).filter(
+            Email.message_id.in_(message_ids),
+            Email.user_id == user_id
+        ).all()
+
+        for email in emails:
+            if hasattr(email, 'is_read'):
+                email.is_read = True
+            if email.labels:
+                labels_list = [l.strip() for l in email.labels.split(",") if l.strip()]
+                email.labels = ",".join(l for l in labels_list if l != "UNREAD")
+        db.commit()
+
+        logger.debug(f"Marked {len(message_ids)} emails as read")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error marking emails as read: {e}")
         return False
 
 
@@ -369,11 +708,11 @@ def mark_email_as_unread(db, user_id: int, message_id: str) -> bool:
             email.is_read = False
             db.commit()
         
-        print(f" Marked email {message_id} as unread")
+        logger.debug(f"Marked email {message_id} as unread")
         return True
         
     except Exception as e:
-        print(f" Error marking email as unread: {e}")
+        logger.error(f"Error marking email as unread: {e}")
         return False
 
 
@@ -398,9 +737,9 @@ def delete_email(db, user_id: int, message_id: str) -> bool:
             db.delete(email)
             db.commit()
         
-        print(f" Deleted email {message_id}")
+        logger.debug(f"Deleted email {message_id}")
         return True
         
     except Exception as e:
-        print(f" Error deleting email: {e}")
+        logger.error(f"Error deleting email: {e}")
         return False
\ No newline at end of file
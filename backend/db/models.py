@@ -42,6 +42,7 @@ def create_or_update_user(db: Session, google_user_id: str, email: str, access_t
         user.email = email
         user.access_token = access_token
         user.refresh_token = refresh_token
+        user.token_created = datetime.utcnow()
     else:
         user = User(
             google_user_id=google_user_id,
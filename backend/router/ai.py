@@ -1,17 +1,19 @@
 # backend/routes/ai_router.py
+import json
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
-import pytz
 from sqlalchemy.orm import Session
 from backend.services.sentiment_analysis import analyze_sentiment
-from backend.services.summarize_emails import summarize_email
-from backend.services.caption_emails import caption_email
-from backend.services.calender import process_email, create_event
-from backend.services.classifier import classifier
+from backend.services.summarize_emails import summarize_email, summarize_emails_batch
+from backend.services.caption_emails import caption_email, caption_emails_batch
+from backend.services.combined_analyze import analyze_email, analyze_emails
+from backend.services.calender import process_email, create_event, KARACHI
 from backend.db.database import get_db
+from backend.db.gmail_service import get_calendar_service
 from backend.router.dependencies import get_current_user
-from backend.services.compose_reply import generate_email_reply, generate_new_email
+from backend.services.compose_reply import generate_email_reply, generate_new_email, stream_email_reply
 
 router = APIRouter(tags=["AI"])
 
@@ -20,6 +22,9 @@ router = APIRouter(tags=["AI"])
 class EmailRequest(BaseModel):
     email_text: str
 
+class EmailBatchRequest(BaseModel):
+    email_texts: list[str]
+
 class EmailReplyRequest(BaseModel):
     sender: str
     subject: str
@@ -57,19 +62,62 @@ def caption_email_endpoint(request: EmailRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/summarize/batch")
+def summarize_emails_endpoint(request: EmailBatchRequest):
+    try:
+        return {"summaries": summarize_emails_batch(request.email_texts)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/caption/batch")
+def caption_emails_endpoint(request: EmailBatchRequest):
+    try:
+        return {"captions": caption_emails_batch(request.email_texts)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze")
+def analyze_email_endpoint(request: EmailRequest):
+    """
+    Caption, summary, date/time and intent for an email in a single LLM call.
+    """
+    try:
+        return analyze_email(request.email_text)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze/batch")
+def analyze_emails_endpoint(request: EmailBatchRequest):
+    """
+    Analyze several emails at once; the LLM calls run concurrently.
+    """
+    try:
+        return {"results": analyze_emails(request.email_texts)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/process-email-event")
-def process_email_event_endpoint(request: EmailRequest):
+def process_email_event_endpoint(
+    request: EmailRequest,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
     Extract date/time from email and create Google Calendar event.
     """
     try:
-        process_email(request.email_text) 
+        service = get_calendar_service(db, current_user.id)
+        process_email(service, request.email_text) 
         return {"status": "Event processed (check Google Calendar)."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/create-event")
-def create_calendar_event_endpoint(request: CalendarEventRequest):
+def create_calendar_event_endpoint(
+    request: CalendarEventRequest,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
     Create event from provided summary/description/start/end times.
     """
@@ -78,13 +126,13 @@ def create_calendar_event_endpoint(request: CalendarEventRequest):
         start_dt = datetime.fromisoformat(request.start_time)
         end_dt = datetime.fromisoformat(request.end_time)
         
-        karachi_tz = pytz.timezone("Asia/Karachi")
         if start_dt.tzinfo is None:
-            start_dt = karachi_tz.localize(start_dt)
+            start_dt = start_dt.replace(tzinfo=KARACHI)
         if end_dt.tzinfo is None:
-            end_dt = karachi_tz.localize(end_dt)
+            end_dt = end_dt.replace(tzinfo=KARACHI)
 
         create_event(
+            get_calendar_service(db, current_user.id),
             summary=request.summary,
             description=request.description,
             start_time=start_dt,
@@ -113,6 +161,34 @@ def reply_email_endpoint(request: EmailReplyRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/reply/stream")
+def reply_email_stream_endpoint(request: EmailReplyRequest):
+    """
+    Same as /reply, but streams the result as NDJSON while the LLM generates it:
+    one line each for detected_intent and reply_subject, then reply_body chunks.
+    """
+    try:
+        reply = stream_email_reply(
+            sender=request.sender,
+            subject=request.subject,
+            email_text=request.email_text,
+            your_name=request.your_name,
+            tone=request.tone,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def events():
+        try:
+            for field, value in reply:
+                yield json.dumps({field: value}) + "\n"
+        except Exception as e:
+            # Headers are already sent; report the failure in the stream
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
     
 @router.post("/generate-email")
 def generate_email_endpoint(request: NewEmailRequest):
@@ -134,12 +210,6 @@ class ClassifyRequest(BaseModel):
     subject: str
     body: str
 
-from backend.services.classifier import classifier
-
-class ClassifyRequest(BaseModel):
-    subject: str
-    body: str
-
 
 class SentimentRequest(BaseModel):
     subject: str
@@ -151,6 +221,9 @@ def classify_email_endpoint(
     current_user=Depends(get_current_user)
 ):
     """Classify an email into a category."""
+    # Imported on first use: loading torch and the model takes seconds
+    from backend.services.classifier import classifier
+
     try:
         result = classifier.classify(request.subject, request.body)
         return result
@@ -2,10 +2,10 @@ from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from groq import BaseModel
 from sqlalchemy.orm import Session
 from backend.db.database import get_db
-from backend.db.gmail_service import fetch_user_emails, get_gmail_service
+from backend.db.gmail_service import fetch_user_emails, get_gmail_service, get_plain_text, mark_emails_as_read
 from backend.db.models import Email, User
 from backend.RAG.rag_service import rag_system
-from backend.services.send_email import get_mime_message, get_email_content, create_message, send_message
+from backend.services.send_email import create_message, send_message
 from backend.router.dependencies import get_current_user
 from sqlalchemy import nullslast
 
@@ -14,6 +14,9 @@ router = APIRouter(tags=["Email"])
 class RAGQuestionRequest(BaseModel):
     question: str
 
+class MarkReadRequest(BaseModel):
+    ids: list[str]
+
 
 # Endpoint to start background sync
 @router.post("/sync/background")
@@ -30,14 +33,16 @@ def start_background_sync(
 
 @router.post("/sync")
 def sync_inbox(
+    with_body: bool = True,
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
-    Fetch unread emails, storing snippet + body in DB with full labels and dates
+    Fetch unread emails, storing snippet + body in DB with full labels and dates.
+    Pass with_body=false to store headers and snippets only; /read fetches the body later.
     """
     try:
-        saved_count = fetch_user_emails(db, current_user.id, max_results=100)
+        saved_count = fetch_user_emails(db, current_user.id, max_results=100, with_body=with_body)
         return {"status": "Inbox synced", "emails_fetched": saved_count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,11 +127,7 @@ def read_email(
     """
     try:
         service = get_gmail_service(db, current_user.id)
-        mime_msg = get_mime_message(service, "me", msg_id)
-        if not mime_msg:
-            raise HTTPException(status_code=404, detail="Email not found")
-
-        body = get_email_content(mime_msg)
+        body = get_plain_text(service, msg_id)
 
         email_db = db.query(Email).filter(
             Email.user_id == current_user.id,
@@ -163,6 +164,20 @@ def read_email(
 
 
 
+#  Mark several emails as read in one Gmail request
+
+@router.post("/mark-read")
+def mark_read(
+    request: MarkReadRequest,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not mark_emails_as_read(db, current_user.id, request.ids):
+        raise HTTPException(status_code=500, detail="Failed to mark emails as read")
+    return {"status": "ok", "marked": len(request.ids)}
+
+
+
 #  Send email
 
 @router.post("/send")
@@ -0,0 +1,35 @@
+import os
+from functools import cache
+import groq as Groq
+from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+# Bound every request so a stalled call cannot hold a worker thread
+GROQ_TIMEOUT = 30.0
+GROQ_MAX_RETRIES = 3
+
+
+def make_client(api_key):
+    """Groq client with a request timeout and SDK-level retries."""
+    return Groq.Client(api_key=api_key, timeout=GROQ_TIMEOUT, max_retries=GROQ_MAX_RETRIES)
+
+
+@cache
+def get_client(key_name="GROQ_API_KEY"):
+    """
+    Process-wide Groq client for the given API key variable, created on first use.
+    Sharing one client lets every service reuse the same connection pool.
+    """
+    load_dotenv()
+    return make_client(os.getenv(key_name))
+
+
+@retry(
+    retry=retry_if_exception_type(Groq.RateLimitError),
+    wait=wait_exponential(min=1, max=16),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+def create_completion(client, **kwargs):
+    """client.chat.completions.create with exponential backoff on rate limits."""
+    return client.chat.completions.create(**kwargs)
@@ -1,8 +1,9 @@
-import groq as Groq
+from backend.services._groq_client import get_client, create_completion
 import os
 from dotenv import load_dotenv
 import streamlit as st
-from backend.services.email_processor import preprocess_email
+from backend.services.email_processor import complete_in_batches, preprocess_for_llm
+from backend.services.llm_cache import llm_cache
 
 # Load variables from .env file
 load_dotenv()
@@ -11,45 +12,58 @@ GROQ_API_KEY =  os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Groq API key not found in .env or Streamlit secrets.")
 
-# Initialize Groq client
-client = Groq.Client(api_key=GROQ_API_KEY)
+# Emails captioned per Groq call in caption_emails_batch
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 8))
+# Email text per email and per batched call, the same limit as the single-email prompt
+BATCH_MAX_TOKENS = 3000
+_BATCH_PROMPT = """You create short, descriptive 5-10 word captions for emails.
+Focus on: main topic, urgency, and key action.
+Return strict JSON only: {"captions": ["...", ...]} with one caption per email, in order."""
+
+@llm_cache(ttl=3600)
+def _caption_email(text):
+    # Preprocess for captioning 
+    processed_text, _ = preprocess_for_llm(text, max_tokens=3000)
+    
+    response = create_completion(
+        get_client(),
+        model="llama-3.1-8b-instant", 
+        messages=[
+            {
+                "role": "system", 
+                "content": """You are an expert at creating short, descriptive captions for emails. 
+                Create a 5-10 word caption that captures the essence of the email.
+                Focus on: main topic, urgency, and key action.
+                Examples:
+                - "Meeting request for project discussion"
+                - "Urgent: Client feedback needed by EOD"
+                - "Weekly team update and progress report"
+                - "Invoice payment confirmation and details"
+                Keep it concise and descriptive."""
+            },
+            {
+                "role": "user", 
+                "content": f"Create a short descriptive caption for this email:\n\n{processed_text}"
+            }
+        ],
+        max_tokens=24,
+        stop=["\n"],
+        temperature=0.3
+    )
+    return response.choices[0].message.content.strip()
+
 
 def caption_email(text):
     
     try:
-        # Preprocess for captioning 
-        processed_text = preprocess_email(text, max_tokens=3000)
-        
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant", 
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are an expert at creating short, descriptive captions for emails. 
-                    Create a 5-10 word caption that captures the essence of the email.
-                    Focus on: main topic, urgency, and key action.
-                    Examples:
-                    - "Meeting request for project discussion"
-                    - "Urgent: Client feedback needed by EOD"
-                    - "Weekly team update and progress report"
-                    - "Invoice payment confirmation and details"
-                    Keep it concise and descriptive."""
-                },
-                {
-                    "role": "user", 
-                    "content": f"Create a short descriptive caption for this email:\n\n{processed_text}"
-                }
-            ],
-            max_tokens=100,
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
+        return _caption_email(text)
         
     except Exception as e:
         if "413" in str(e) or "too large" in str(e).lower():
             # Try with even shorter text
-            very_short_text = preprocess_email(text, max_tokens=1500)
-            response = client.chat.completions.create(
+            very_short_text, _ = preprocess_for_llm(text, max_tokens=1500)
+            response = create_completion(
+                get_client(),
                 model="llama-3.1-8b-instant", 
                 messages=[
                     {
@@ -61,10 +75,19 @@ def caption_email(text):
                         "content": f"Short caption:\n\n{very_short_text}"
                     }
                 ],
-                max_tokens=50,
+                max_tokens=24,
+                stop=["\n"],
                 temperature=0.3
             )
             return f" {response.choices[0].message.content.strip()}"
         else:
             st.error(f"Caption generation error: {e}")
-            return "Email caption unavailable"
\ No newline at end of file
+            return "Email caption unavailable"
+
+
+def caption_emails_batch(texts):
+    """Caption many emails, several per Groq call (see complete_in_batches)."""
+    return complete_in_batches(
+        texts, _caption_email, caption_email, _BATCH_PROMPT, "captions",
+        max_tokens=BATCH_MAX_TOKENS, output_tokens=24, batch_size=BATCH_SIZE,
+    )
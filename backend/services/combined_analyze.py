@@ -0,0 +1,78 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from backend.services._groq_client import get_client, create_completion
+import os
+from dotenv import load_dotenv
+from backend.services.email_processor import preprocess_for_llm
+from backend.services.llm_cache import llm_cache
+
+# Load variables from .env file
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+if not GROQ_API_KEY:
+    raise ValueError("Groq API key not found in .env")
+
+INTENT_LABELS = (
+    "complaint", "inquiry", "meeting_request", "follow_up",
+    "thank_you", "job_application", "other",
+)
+
+# Concurrent Groq calls for a batch of emails
+ANALYZE_WORKERS = 8
+
+
+@llm_cache
+def analyze_email(text):
+    """
+    Caption, summarize, extract date/time and detect intent in one Groq call.
+    The email body is sent once instead of once per task.
+    """
+    processed_text, _ = preprocess_for_llm(text, max_tokens=5000)
+
+    response = create_completion(
+        get_client(),
+        model="llama-3.1-8b-instant",
+        response_format={"type": "json_object"},
+        messages=[
+            {
+                "role": "system",
+                "content": f"""You analyze emails and return strict JSON only, with exactly these keys:
+                - "caption": a 5-10 word caption capturing the main topic, urgency and key action
+                - "summary": a brief summary with key points, action items and deadlines (if any)
+                - "datetime": the date and time of any meeting or event mentioned, or null
+                - "intent": one of {" | ".join(INTENT_LABELS)}"""
+            },
+            {
+                "role": "user",
+                "content": f"Analyze this email:\n\n{processed_text}"
+            }
+        ],
+        max_tokens=700,
+        temperature=0.3
+    )
+
+    result = json.loads(response.choices[0].message.content)
+    intent = result.get("intent") or "other"
+
+    return {
+        "caption": str(result.get("caption") or "").strip(),
+        "summary": str(result.get("summary") or "").strip(),
+        "datetime": result.get("datetime"),
+        "intent": intent if intent in INTENT_LABELS else "other",
+    }
+
+
+def analyze_emails(texts):
+    """
+    Analyze several emails concurrently instead of one after another.
+    Each item is the analyze_email result, or {"error": ...} if that email failed.
+    """
+    def _safe_analyze(text):
+        try:
+            return analyze_email(text)
+        except Exception as e:
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=ANALYZE_WORKERS) as executor:
+        return list(executor.map(_safe_analyze, texts))
@@ -1,21 +1,19 @@
 # backend/services/reply_email.py
 
-import groq as Groq
-import os
+from backend.services._groq_client import get_client, create_completion
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY2")
-client = Groq.Client(api_key=GROQ_API_KEY)
 
-def generate_email_reply(
-    sender: str,
-    subject: str,
-    email_text: str,
-    your_name: str = "Assistant",
-    tone: str = "professional",
-) -> dict:
-    prompt = f"""You are an expert email assistant. Carefully read the email below and do two things:
+# The model is asked to answer in a fixed INTENT/SUBJECT/BODY layout. Each
+# field line is matched on its own, so stray lines or a different order
+# before BODY: still parse.
+_FIELD_RE = re.compile(r"^[ \t]*(INTENT|SUBJECT|BODY):[ \t]*(.*)$", re.MULTILINE)
+_FIELD_NAMES = {"INTENT": "detected_intent", "SUBJECT": "reply_subject"}
+
+def _reply_prompt(sender: str, subject: str, email_text: str, your_name: str, tone: str) -> str:
+    return f"""You are an expert email assistant. Carefully read the email below and do two things:
 
 1. Detect the primary intent of the email. Choose the single best label from:
    complaint | inquiry | meeting_request | follow_up | thank_you | job_application | other
@@ -40,9 +38,21 @@ BODY:
 <full reply body>
 """
 
-    response = client.chat.completions.create(
+
+def generate_email_reply(
+    sender: str,
+    subject: str,
+    email_text: str,
+    your_name: str = "Assistant",
+    tone: str = "professional",
+) -> dict:
+    prompt = _reply_prompt(sender, subject, email_text, your_name, tone)
+
+    response = create_completion(
+        get_client("GROQ_API_KEY2"),
         model="llama-3.1-8b-instant",
         max_tokens=1024,
+        stop=["\n---"],
         messages=[{"role": "user", "content": prompt}],
     )
 
@@ -50,26 +60,121 @@ BODY:
     return _parse_reply(raw)
 
 
-def _parse_reply(raw: str) -> dict:
-    intent = ""
-    subject = ""
-    body_lines = []
+def stream_email_reply(
+    sender: str,
+    subject: str,
+    email_text: str,
+    your_name: str = "Assistant",
+    tone: str = "professional",
+):
+    """
+    Stream a reply while the model generates it.
+    The Groq request is sent before this returns, so connection, auth and
+    rate-limit errors are raised here rather than mid-stream.
+    The returned generator yields ("detected_intent", str) and
+    ("reply_subject", str) once each header line is complete, then
+    ("reply_body", chunk) for the body text. The fields joined back
+    together match what _parse_reply returns for the same output.
+    """
+    prompt = _reply_prompt(sender, subject, email_text, your_name, tone)
+
+    response = create_completion(
+        get_client("GROQ_API_KEY2"),
+        model="llama-3.1-8b-instant",
+        max_tokens=1024,
+        stop=["\n---"],
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    return _iter_reply(response)
+
+
+def _iter_reply(response):
+    """Yield the fields _parse_layout would return, as the text arrives."""
+    pending = dict(_FIELD_NAMES)  # headers not yielded yet; the first wins
+    buffer = ""
+    other_lines = []  # non-header lines, the body if BODY: never arrives
     in_body = False
+    body_started = False
+    trailing = ""     # held back so the body is stripped like _parse_layout's
+
+    for chunk in response:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+
+        if not in_body:
+            buffer += delta
+            # Header lines are only parsed once they are complete
+            while not in_body and "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                m = _FIELD_RE.match(line)
+                if not m:
+                    other_lines.append(line)
+                elif m[1] == "BODY":
+                    in_body = True
+                    # Keep text written on the BODY: line itself
+                    buffer = m[2] + "\n" + buffer
+                elif m[1] in pending:
+                    yield pending.pop(m[1]), m[2].strip()
+            if not in_body:
+                continue
+            delta, buffer = buffer, ""
+
+        if not body_started:
+            delta = delta.lstrip()
+            if not delta:
+                continue
+            body_started = True
+        text = trailing + delta
+        delta = text.rstrip()
+        trailing = text[len(delta):]
+        if delta:
+            yield "reply_body", delta
+
+    if in_body:
+        return
+
+    # The stream ended without a complete BODY: line
+    m = _FIELD_RE.match(buffer)
+    if not m:
+        other_lines.append(buffer)
+    elif m[1] == "BODY":
+        other_lines = [m[2]]
+    elif m[1] in pending:
+        yield pending.pop(m[1]), m[2].strip()
+    body = "\n".join(other_lines).strip()
+    if body:
+        yield "reply_body", body
+
+
+def _parse_layout(raw: str) -> dict:
+    """
+    Split model output written in the INTENT/SUBJECT/BODY layout.
+    INTENT: and SUBJECT: are read from the lines before BODY: (the first of
+    each wins) and the body is everything after BODY:, including text on
+    that line. Without a BODY: line, every line that is not a header is
+    the body.
+    """
+    fields = {}
+    for m in _FIELD_RE.finditer(raw):
+        if m[1] == "BODY":
+            fields["reply_body"] = raw[m.start(2):].strip()
+            break
+        fields.setdefault(_FIELD_NAMES[m[1]], m[2].strip())
+    else:
+        fields["reply_body"] = "\n".join(
+            line for line in raw.split("\n") if not _FIELD_RE.match(line)
+        ).strip()
+    return fields
 
-    for line in raw.splitlines():
-        if line.startswith("INTENT:"):
-            intent = line.replace("INTENT:", "").strip()
-        elif line.startswith("SUBJECT:"):
-            subject = line.replace("SUBJECT:", "").strip()
-        elif line.startswith("BODY:"):
-            in_body = True
-        elif in_body:
-            body_lines.append(line)
 
+def _parse_reply(raw: str) -> dict:
+    fields = _parse_layout(raw)
     return {
-        "reply_subject": subject,
-        "reply_body": "\n".join(body_lines).strip(),
-        "detected_intent": intent,
+        "reply_subject": fields.get("reply_subject", ""),
+        "reply_body": fields["reply_body"],
+        "detected_intent": fields.get("detected_intent", ""),
     }
 
 def generate_new_email(to: str, topic: str, tone: str = "professional", additional_context: str = "") -> dict:
@@ -91,9 +196,11 @@ BODY:
 <full email body>
 """
 
-    response = client.chat.completions.create(
+    response = create_completion(
+        get_client("GROQ_API_KEY2"),
         model="llama-3.1-8b-instant",
         max_tokens=1024,
+        stop=["\n---"],
         messages=[{"role": "user", "content": prompt}],
     )
 
@@ -102,19 +209,8 @@ BODY:
 
 
 def _parse(raw: str) -> dict:
-    subject = ""
-    body_lines = []
-    in_body = False
-
-    for line in raw.splitlines():
-        if line.startswith("SUBJECT:"):
-            subject = line.replace("SUBJECT:", "").strip()
-        elif line.startswith("BODY:"):
-            in_body = True
-        elif in_body:
-            body_lines.append(line)
-
+    fields = _parse_layout(raw)
     return {
-        "subject": subject,
-        "body": "\n".join(body_lines).strip(),
-    }
\ No newline at end of file
+        "subject": fields.get("reply_subject", ""),
+        "body": fields["reply_body"],
+    }
@@ -1,37 +1,68 @@
+import json
 import re
+from bs4 import BeautifulSoup
+from backend.services._groq_client import get_client, create_completion
 
 def truncate_email_content(email_content, max_tokens=5000):
     max_chars = int(max_tokens * 3.5)
-    truncated = False
 
-    if len(email_content) > max_chars:
-        email_content = email_content[:max_chars] + "... [content truncated]"
-        truncated = True
+    if len(email_content) <= max_chars:
+        return email_content, False
 
-    return email_content, truncated
+    # Prefer cutting at a sentence boundary close to the limit
+    end = email_content.rfind('. ', max(0, max_chars - 500), max_chars)
+    end = end + 1 if end != -1 else max_chars
 
+    return email_content[:end] + "... [content truncated]", True
 
-def clean_email_content(email_content):
-    lines = email_content.split('\n')
-    cleaned_lines = []
-    in_quoted_section = False
 
-    for line in lines:
-        line_stripped = line.strip()
+# A quoted/forwarded block starts at a line beginning with one of these
+# markers and runs up to (and including) the next blank line.
+_QUOTE_PREFIXES = ('>', 'On', 'From:', 'Sent:', 'To:', 'Subject:')
+_QUOTED_BLOCK_RE = re.compile(
+    r"^[^\S\n]*(?:" + "|".join(map(re.escape, _QUOTE_PREFIXES)) + r")[^\n]*(?:\n|\Z)"
+    r"(?:(?![^\S\n]*(?:\n|\Z))[^\n]*(?:\n|\Z))*"
+    r"(?:[^\S\n]*(?:\n|\Z))?",
+    re.MULTILINE,
+)
+# Stricter markers for LLM input: quoted "> " lines, a reply attribution
+# ("On ... wrote:", possibly wrapped once) and a forwarded From: header
+# followed by Sent:/Date:/To:/Cc:/Subject: lines. Only the marker lines are
+# removed, and ordinary lines that happen to start with "On" or "To:" stay.
+_LLM_QUOTE_RE = re.compile(
+    r"^[^\S\n]*>[^\n]*(?:\n|\Z)"
+    r"|^[^\S\n]*On\b[^\n]*(?:\n[^\n]*)?\bwrote:[^\S\n]*(?:\n|\Z)"
+    r"|^[^\S\n]*From:[^\n]*\n(?:[^\S\n]*(?:Sent|Date|To|Cc|Subject):[^\n]*(?:\n|\Z))+",
+    re.MULTILINE,
+)
+_BLANKS_RE = re.compile(r'\n\s*\n')
+_WS_RE = re.compile(r'[ \t]+')
 
-        if line_stripped.startswith(('>', 'On', 'From:', 'Sent:', 'To:', 'Subject:')):
-            in_quoted_section = True
-            continue
-        elif in_quoted_section and line_stripped == '':
-            in_quoted_section = False
-            continue
+# Elements that start a new paragraph when HTML is flattened to text
+_BLOCK_TAGS = (
+    "address", "article", "blockquote", "dd", "div", "dl", "dt", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol", "p",
+    "pre", "section", "table", "tr", "ul",
+)
+_HTML_TAG_RE = re.compile(r"<(?:[a-zA-Z][\w-]*(?=[\s/>])|!--|!doctype)[^>]*>", re.IGNORECASE)
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_EMAIL_RE = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")
+# A leading + or a 3-3-4 grouping, so dates and times are not masked
+_PHONE_RE = re.compile(r"\+\d[\d\s\-()]{7,}\d|\(?\b\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}\b")
+
+
+def clean_email_content(email_content):
+    cleaned_content = _QUOTED_BLOCK_RE.sub('', email_content)
+    cleaned_content = _BLANKS_RE.sub('\n\n', cleaned_content)
+    cleaned_content = _WS_RE.sub(' ', cleaned_content)
+
+    return cleaned_content.strip()
 
-        if not in_quoted_section:
-            cleaned_lines.append(line)
 
-    cleaned_content = '\n'.join(cleaned_lines)
-    cleaned_content = re.sub(r'\n\s*\n', '\n\n', cleaned_content)
-    cleaned_content = re.sub(r'[ \t]+', ' ', cleaned_content)
+def _clean_for_llm(email_content):
+    cleaned_content = _LLM_QUOTE_RE.sub('', email_content)
+    cleaned_content = _BLANKS_RE.sub('\n\n', cleaned_content)
+    cleaned_content = _WS_RE.sub(' ', cleaned_content)
 
     return cleaned_content.strip()
 
@@ -40,3 +71,124 @@ def preprocess_email(email_content, max_tokens=5000):
     cleaned = clean_email_content(email_content)
     processed, truncated = truncate_email_content(cleaned, max_tokens)
     return processed, truncated
+
+
+def strip_html(email_content):
+    # Plain-text bodies skip the HTML parser entirely
+    if not _HTML_TAG_RE.search(email_content[:1024]):
+        return email_content
+
+    soup = BeautifulSoup(email_content, "html.parser")
+    for tag in soup(["script", "style", "head"]):
+        tag.decompose()
+    # Block elements become paragraphs; inline tags (<a>, <b>, ...) stay
+    # inside their sentence so "On ... <a>bob</a> wrote:" is one line
+    for tag in soup("br"):
+        tag.replace_with("\n")
+    for tag in soup(["td", "th"]):
+        tag.insert_after(" ")
+    for tag in soup(_BLOCK_TAGS):
+        tag.insert_before("\n\n")
+        tag.insert_after("\n\n")
+    return soup.get_text()
+
+
+def mask_entities(text):
+    """Replace URLs, email addresses and phone numbers with short tags."""
+    text = _URL_RE.sub("<URL>", text)
+    text = _EMAIL_RE.sub("<EMAIL>", text)
+    text = _PHONE_RE.sub("<PHONE>", text)
+    return text
+
+
+def preprocess_for_llm(email_content, max_tokens=5000):
+    """
+    preprocess_email plus HTML stripping and URL/email/phone masking,
+    which cuts the tokens sent for captions and summaries. Only clear
+    quote markers are removed (see _LLM_QUOTE_RE), so paragraphs that
+    begin with "On" or "To:" reach the model.
+
+    >>> html = "<p>Hi Tom,</p><p>On Friday we meet at 10:30.</p><p>To: all staff</p><p>Bring slides.</p>"
+    >>> preprocess_for_llm(html)[0].split("\\n\\n")
+    ['Hi Tom,', 'On Friday we meet at 10:30.', 'To: all staff', 'Bring slides.']
+    """
+    cleaned = _clean_for_llm(strip_html(email_content))
+    processed, truncated = truncate_email_content(mask_entities(cleaned), max_tokens)
+    return processed, truncated
+
+
+def batch_by_size(texts, max_count, max_tokens):
+    """
+    Group texts into batches of at most max_count texts and about max_tokens
+    in total. Yields lists of indices into texts; a text over the limit on
+    its own gets a batch to itself.
+    """
+    max_chars = int(max_tokens * 3.5)
+    batch, size = [], 0
+    for i, text in enumerate(texts):
+        if batch and (len(batch) >= max_count or size + len(text) > max_chars):
+            yield batch
+            batch, size = [], 0
+        batch.append(i)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+def _complete_batch(processed_texts, system_prompt, key, output_tokens):
+    emails = "\n\n".join(
+        f"### Email {i + 1}\n{text}"
+        for i, text in enumerate(processed_texts)
+    )
+    response = create_completion(
+        get_client(),
+        model="llama-3.1-8b-instant",
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Here are {len(processed_texts)} emails:\n\n{emails}"}
+        ],
+        max_tokens=output_tokens * len(processed_texts) + 20,
+        temperature=0.3
+    )
+    values = json.loads(response.choices[0].message.content).get(key, [])
+    if len(values) != len(processed_texts):
+        raise ValueError(f"Got {len(values)} {key} for {len(processed_texts)} emails")
+    return [str(v).strip() for v in values]
+
+
+def complete_in_batches(texts, cached, fallback, system_prompt, key, max_tokens, output_tokens, batch_size):
+    """
+    Run a one-email LLM task over many texts with one Groq call per batch,
+    so the instructions are sent once per batch instead of once per email.
+
+    cached is the task's llm_cache-wrapped single-email function: its
+    entries are served first and batch results are stored in it. Emails are
+    preprocessed with that function's max_tokens, and a batch holds at most
+    batch_size emails and max_tokens of text, so no request is larger than
+    the single-email prompt. system_prompt must ask for {key: [...]} with
+    one entry per email; if a batch fails, fallback(text) runs per email.
+    """
+    results = [None] * len(texts)
+    todo = []
+    for i, text in enumerate(texts):
+        hit, value = cached.cache_get(text)
+        if hit:
+            results[i] = value
+        else:
+            todo.append(i)
+
+    processed = [preprocess_for_llm(texts[i], max_tokens)[0] for i in todo]
+    for group in batch_by_size(processed, batch_size, max_tokens):
+        indices = [todo[k] for k in group]
+        try:
+            values = _complete_batch([processed[k] for k in group], system_prompt, key, output_tokens)
+        except Exception as e:
+            print(f"Batch {key} failed, falling back to one email per call: {e}")
+            for i in indices:
+                results[i] = fallback(texts[i])
+            continue
+        for i, value in zip(indices, values):
+            results[i] = value
+            cached.cache_set(value, texts[i])
+    return results
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+def _cache_key(func, args, kwargs) -> str:
+    """Content hash of the function and its (text) arguments."""
+    raw = f"{func.__module__}.{func.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def llm_cache(func=None, *, maxsize: int = 512, ttl: float = None):
+    """
+    Memoize an LLM-backed function on a content hash of its arguments.
+    Only successful results are stored; exceptions propagate uncached.
+    Least recently used entries are evicted once maxsize is reached, and
+    entries older than ttl seconds (if given) are recomputed.
+    """
+    def decorator(fn):
+        store: "OrderedDict[str, tuple]" = OrderedDict()
+        lock = threading.Lock()
+
+        def _lookup(key):
+            with lock:
+                if key in store:
+                    stored_at, value = store[key]
+                    if ttl is None or time.monotonic() - stored_at < ttl:
+                        store.move_to_end(key)
+                        return True, value
+                    del store[key]
+            return False, None
+
+        def _store(key, value):
+            with lock:
+                store[key] = (time.monotonic(), value)
+                store.move_to_end(key)
+                while len(store) > maxsize:
+                    store.popitem(last=False)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(fn, args, kwargs)
+            hit, value = _lookup(key)
+            if hit:
+                return value
+
+            result = fn(*args, **kwargs)
+            _store(key, result)
+            return result
+
+        def cache_get(*args, **kwargs):
+            """(True, value) if a fresh entry exists for these arguments, else (False, None)."""
+            return _lookup(_cache_key(fn, args, kwargs))
+
+        def cache_set(value, *args, **kwargs):
+            """Store a result computed elsewhere (e.g. by a batch call) for these arguments."""
+            _store(_cache_key(fn, args, kwargs), value)
+
+        def cache_clear():
+            with lock:
+                store.clear()
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_get = cache_get
+        wrapper.cache_set = cache_set
+        wrapper.cache_size = lambda: len(store)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
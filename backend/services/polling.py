@@ -1,31 +1,34 @@
 import threading
 import time
+import logging
 from datetime import datetime
 from backend.db.database import SessionLocal
 from backend.db.gmail_service import fetch_user_emails
 from backend.RAG.rag_backgroundservice import rag_service
 
+logger = logging.getLogger(__name__)
+
 polling_threads: dict = {}
 
 def _auto_index_after_fetch(user_email: str):
     rag_service.request_index(user_email)
-    print(f"   Re-index queued for {user_email}")
+    logger.debug(f"Re-index queued for {user_email}")
 
 def _poll_emails_continuously(user_id: int, user_email: str, interval: int = 60):
-    print(f"Polling thread started for user {user_id} ({user_email})")
+    logger.info(f"Polling thread started for user {user_id} ({user_email})")
     while True:
         db = SessionLocal()
         try:
             ts = datetime.now().strftime('%H:%M:%S')
-            print(f"[{ts}] Fetching emails for user {user_id}...")
+            logger.debug(f"[{ts}] Fetching emails for user {user_id}...")
             new_count = fetch_user_emails(db, user_id)
             if new_count > 0:
-                print(f"[{ts}] Fetched {new_count} new emails")
+                logger.info(f"[{ts}] Fetched {new_count} new emails")
                 _auto_index_after_fetch(user_email)
             else:
-                print(f"  [{ts}] No new emails")
+                logger.debug(f"[{ts}] No new emails")
         except Exception as e:
-            print(f" Polling error for user {user_id}: {e}")
+            logger.error(f"Polling error for user {user_id}: {e}")
         finally:
             db.close()
         time.sleep(interval)
@@ -41,7 +44,7 @@ def on_new_user_login(user_id: int, user_email: str):
         )
         thread.start()
         polling_threads[user_id] = thread
-        print(f" Polling thread started for new user {user_id} ({user_email})")
+        logger.info(f"Polling thread started for new user {user_id} ({user_email})")
 
 def start_polling_threads():
     from backend.db import models
@@ -50,7 +53,7 @@ def start_polling_threads():
         users = db.query(models.User).filter(
             models.User.access_token.isnot(None)
         ).all()
-        print(f"\n Starting email polling for {len(users)} user(s)...\n")
+        logger.info(f"Starting email polling for {len(users)} user(s)...")
         for user in users:
             thread = threading.Thread(
                 target=_poll_emails_continuously,
@@ -61,6 +64,6 @@ def start_polling_threads():
             thread.start()
             polling_threads[user.id] = thread
     except Exception as e:
-        print(f" Failed to start polling threads: {e}")
+        logger.error(f"Failed to start polling threads: {e}")
     finally:
         db.close()
\ No newline at end of file
@@ -1,7 +1,16 @@
 import base64
+import binascii
 import email
 from email.mime.text import MIMEText
 
+_URLSAFE_TO_STD = bytes.maketrans(b"-_", b"+/")
+
+def fast_b64decode(data):
+  """URL-safe base64 decode straight through binascii, skipping base64's extra copies."""
+  if isinstance(data, str):
+    data = data.encode("ascii")
+  return binascii.a2b_base64(data.translate(_URLSAFE_TO_STD))
+
 def create_message(sender, to, subject, message_text):
   message = MIMEText(message_text)
   message['to'] = to
@@ -46,10 +55,9 @@ def get_message(service, user_id, msg_id):
 def get_mime_message(service, user_id, msg_id):
   try:
     message = service.users().messages().get(userId=user_id, id=msg_id,
-                                             format='raw').execute()
+                                             format='raw', fields='raw,snippet').execute()
     print('Message snippet: %s' % message['snippet'])
-    msg_str = base64.urlsafe_b64decode(message['raw'].encode("utf-8")).decode("utf-8")
-    mime_msg = email.message_from_string(msg_str)
+    mime_msg = email.message_from_bytes(fast_b64decode(message['raw']))
     return mime_msg
   except Exception as error:
     print('An error occurred: %s' % error)
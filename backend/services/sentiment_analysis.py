@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 import json
-from groq import Groq
+from backend.services._groq_client import get_client, create_completion
 
 load_dotenv()
 
@@ -20,16 +20,6 @@ SENTIMENT_COLORS = {
     "unknown":   "❓",
 }
 
-_groq_client = None
-
-
-def _get_groq_client() -> Groq:
-    global _groq_client
-    if _groq_client is None:
-        _groq_client = Groq(api_key=GROQ_API_KEY)
-    return _groq_client
-
-
 def _extract_json_text(text: str) -> str:
     """Handle models that wrap JSON in markdown code fences."""
     raw = (text or "").strip()
@@ -53,7 +43,7 @@ def analyze_sentiment(subject: str, body: str) -> dict:
         }
 
     try:
-        client = _get_groq_client()
+        client = get_client()
 
         prompt = f"""
 You are an expert email sentiment analyzer. Analyze the sentiment and tone of the following email.
@@ -76,7 +66,8 @@ Rules:
 - explanation should be one clear sentence
 """
 
-        response = client.chat.completions.create(
+        response = create_completion(
+            client,
             model=GROQ_MODEL,
             temperature=0,
             messages=[
@@ -1,8 +1,9 @@
-import groq as Groq
+from backend.services._groq_client import get_client, create_completion
 import os
 from dotenv import load_dotenv
 import streamlit as st
-from backend.services.email_processor import preprocess_email
+from backend.services.email_processor import complete_in_batches, preprocess_for_llm
+from backend.services.llm_cache import llm_cache
 
 # Load variables from .env file
 load_dotenv()
@@ -13,35 +14,50 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Groq API key not found in .env ")
 
-# Initialize Groq client
-client = Groq.Client(api_key=GROQ_API_KEY)
+# Emails summarized per Groq call in summarize_emails_batch
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 8))
+# Email text per email and per batched call, the same limit as the single-email prompt
+BATCH_MAX_TOKENS = 5000
+_BATCH_PROMPT = """You are a concise email summarizer. Summarize each email with:
+- Key points (1 line each)
+- Action items (if any)
+- Deadlines (if any)
+Be brief. No elaboration.
+Return strict JSON only: {"summaries": ["...", ...]} with one summary per email, in order."""
+
+@llm_cache(ttl=3600)
+def _summarize_email(text):
+    # Preprocess the email (clean + truncate)
+    processed_text, _ = preprocess_for_llm(text, max_tokens=5000)
+    
+    response = create_completion(
+        get_client(),
+        model="llama-3.1-8b-instant", 
+        messages=[
+            {
+                "role": "system", 
+                "content": """You are a concise email summarizer. Summarize with:
+                - Key points (1 line each)
+                - Action items (if any)
+                - Deadlines (if any)
+                Be brief. No elaboration."""
+            },
+            {
+                "role": "user", 
+                "content": f"Please summarize this email clearly:\n\n{processed_text}"
+            }
+        ],
+        max_tokens=220,
+        stop=["\n\n---"],
+        temperature=0.3
+    )
+    return response.choices[0].message.content
+
 
 def summarize_email(text):
    
     try:
-        # Preprocess the email (clean + truncate)
-        processed_text = preprocess_email(text, max_tokens=5000)
-        
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant", 
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are a concise email summarizer. Summarize with:
-                    - Key points (1 line each)
-                    - Action items (if any)
-                    - Deadlines (if any)
-                    Be brief. No elaboration."""
-                },
-                {
-                    "role": "user", 
-                    "content": f"Please summarize this email clearly:\n\n{processed_text}"
-                }
-            ],
-            max_tokens=250,
-            temperature=0.3
-        )
-        return response.choices[0].message.content
+        return _summarize_email(text)
         
     except Exception as e:
         if "413" in str(e) or "too large" in str(e).lower():
@@ -51,15 +67,23 @@ def summarize_email(text):
             st.error(f"Summarization error: {e}")
             return "Sorry, I couldn't summarize this email due to an error."
 
+def summarize_emails_batch(texts):
+    """Summarize many emails, several per Groq call (see complete_in_batches)."""
+    return complete_in_batches(
+        texts, _summarize_email, summarize_email, _BATCH_PROMPT, "summaries",
+        max_tokens=BATCH_MAX_TOKENS, output_tokens=220, batch_size=BATCH_SIZE,
+    )
+
 def summarize_long_email_fallback(text):
     """
     Fallback summarization for very long emails.
     """
     try:
         # More aggressive preprocessing
-        processed_text = preprocess_email(text, max_tokens=3000)
+        processed_text, _ = preprocess_for_llm(text, max_tokens=3000)
         
-        response = client.chat.completions.create(
+        response = create_completion(
+            get_client(),
             model="llama-3.1-8b-instant", 
             messages=[
                 {
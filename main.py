@@ -2,6 +2,8 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import logging
+import os
 import threading
 import time
 
@@ -18,6 +20,12 @@ from backend.services.polling import (
     start_polling_threads,
 )
 
+# LOG_LEVEL=DEBUG shows per-poll and per-message sync details
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
 bearer_scheme = HTTPBearer()
 
 @asynccontextmanager